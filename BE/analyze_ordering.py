@@ -0,0 +1,43 @@
+# analyze_ordering.py
+#
+# Quick diagnostic for the ordering debug dump written by the API when
+# /reconstruct is called with ?debug=true. Usage:
+#
+#   python analyze_ordering.py [ordering_debug.json]
+
+import sys
+import json
+
+import numpy as np
+
+
+def analyze_ordering(path: str = "ordering_debug.json"):
+    with open(path, "r") as f:
+        data = json.load(f)
+
+    c = np.asarray(data.get("confidences", []), dtype=np.float32)
+    order = data.get("final_order", [])
+
+    print(f"Pages: {len(order)}")
+    print(f"Final order: {order}")
+
+    if c.size == 0:
+        print("No confidences recorded")
+        return
+
+    print(f"Confidence avg/min/max: {c.mean():.3f} / {c.min():.3f} / {c.max():.3f}")
+    print(f"Low-confidence pages (< 0.6): {int((c < 0.6).sum())}")
+
+    # Sharp drops (confident page followed by a weak one) usually mark spots
+    # where the ordering broke; a single vectorized compare finds them all
+    if c.size > 1:
+        drops = np.where((c[:-1] > 0.8) & (c[1:] < 0.5))[0]
+        for i in drops:
+            print(f"Large confidence drop after position {i}: "
+                  f"{c[i]:.3f} -> {c[i + 1]:.3f}")
+        if drops.size == 0:
+            print("No large confidence drops detected")
+
+
+if __name__ == "__main__":
+    analyze_ordering(sys.argv[1] if len(sys.argv) > 1 else "ordering_debug.json")
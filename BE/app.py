@@ -5,19 +5,28 @@ import io
 import re
 import sys
 import json
+import uuid
+import shutil
+import asyncio
 import tempfile
-from urllib.parse import quote
+import threading
+import concurrent.futures
+from pathlib import Path
 from contextlib import redirect_stdout, redirect_stderr
 from typing import List, Dict, Any, Optional
 
+import gzip
 import uvicorn
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Form
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Form, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 from rich import print as rich_print
 from dotenv import load_dotenv
 
-from services.pdf_svc import extract_texts_from_pdf_bytes, reorder_pdf_bytes
+import numpy as np
+
+from services.pdf_svc import extract_texts_from_pdf_path_iter, pdf_page_count, reorder_pdf_path
 from services.ordering_svc import Orchestrator
 
 
@@ -34,6 +43,46 @@ app.add_middleware(
     expose_headers=["X-Result-Meta"],
 )
 
+# Logs for recent requests, fetchable via GET /logs/{request_id}. Backed by
+# disk (beside the other temp caches) so that under gunicorn -w N the worker
+# serving the GET can read logs written by whichever worker handled the
+# upload; the in-process dict is only a fast path. Bounded either way, so
+# neither the dict nor the directory can grow without limit.
+_LOG_STORE: Dict[str, List[str]] = {}
+_LOG_STORE_MAX = 256
+_LOG_STORE_DIR = Path(tempfile.gettempdir()) / "pdf_backend_logs"
+
+def _store_logs(request_id: str, logs: List[str]):
+    while len(_LOG_STORE) >= _LOG_STORE_MAX:
+        _LOG_STORE.pop(next(iter(_LOG_STORE)))
+    _LOG_STORE[request_id] = logs
+    try:
+        _LOG_STORE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(_LOG_STORE_DIR / f"{request_id}.json", "w", encoding="utf-8") as f:
+            json.dump(logs, f)
+        for stale in sorted(_LOG_STORE_DIR.glob("*.json"), key=os.path.getmtime)[:-_LOG_STORE_MAX]:
+            os.unlink(stale)
+    except OSError:
+        pass
+
+def _load_logs(request_id: str) -> Optional[List[str]]:
+    logs = _LOG_STORE.get(request_id)
+    if logs is not None:
+        return logs
+    # Request ids are uuid4 hex; anything else never hits the filesystem
+    if not re.fullmatch(r"[0-9a-f]{32}", request_id):
+        return None
+    try:
+        with open(_LOG_STORE_DIR / f"{request_id}.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# Compiled once: rich emits many small writes per request, so per-write
+# re.sub pattern compilation and string concatenation add up fast
+_ANSI_RE = re.compile(r'\x1b\[[0-9;]*m')
+_RICH_RE = re.compile(r'\[/?[a-z]+\]')
+
 # Store logs for this request
 request_logs = []
 
@@ -42,88 +91,277 @@ class LogCapture(io.StringIO):
     def __init__(self):
         super().__init__()
         self.logs = []
-        self.buffer = ""
-        
+        # Incomplete-line fragments, joined only when a line completes (O(n)
+        # instead of quadratic += concatenation)
+        self._parts = []
+
     def write(self, text):
         if text and text.strip():
             # Write to actual stdout so it appears in terminal
             sys.__stdout__.write(text)
-            
-            # Store clean version for frontend
-            # Remove ANSI color codes
-            clean_text = re.sub(r'\x1b\[[0-9;]*m', '', text)
-            # Remove rich formatting
-            clean_text = re.sub(r'\[/?[a-z]+\]', '', clean_text)
-            clean_text = clean_text.strip()
-            
+
+            # Store clean version for frontend: strip ANSI codes and rich markup
+            clean_text = _RICH_RE.sub('', _ANSI_RE.sub('', text)).strip()
+
             if clean_text:
                 # Buffer incomplete lines
-                self.buffer += clean_text
-                
+                self._parts.append(clean_text)
+
                 # If we have a complete line (ends with newline in original), store it
                 if text.endswith('\n'):
-                    if self.buffer:
-                        self.logs.append(self.buffer)
-                        self.buffer = ""
+                    self._flush_line()
                 elif '\n' in text:
                     # Handle multiple lines
-                    lines = self.buffer.split('\n')
+                    lines = ''.join(self._parts).split('\n')
+                    self._parts.clear()
                     for line in lines[:-1]:
                         if line.strip():
                             self.logs.append(line.strip())
-                    self.buffer = lines[-1]
-        
+                    if lines[-1]:
+                        self._parts.append(lines[-1])
+
         return len(text)
-    
+
+    def _flush_line(self):
+        if self._parts:
+            self.logs.append(''.join(self._parts))
+            self._parts.clear()
+
     def flush(self):
         sys.__stdout__.flush()
         # Flush any remaining buffer
-        if self.buffer:
-            self.logs.append(self.buffer)
-            self.buffer = ""
+        self._flush_line()
+
+# With multiple workers, split BLAS/torch threads between them so N workers
+# don't each spawn a full complement and oversubscribe the cores
+_WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+if _WORKERS > 1:
+    import torch
+    torch.set_num_threads(max(1, (os.cpu_count() or _WORKERS) // _WORKERS))
 
 orchestrator = Orchestrator()
 
+# Embedding batches fire once this many pages are queued, or after the batch
+# wait expires while extraction is stalled (typically in OCR). Large
+# documents flush in pool-sized batches so _encode_batch's multi-process
+# path (which needs at least _EMBED_BATCH_PAGES_LARGE texts per call to be
+# worth its IPC overhead) stays reachable from the endpoint.
+_EMBED_BATCH_PAGES = 32
+_EMBED_BATCH_PAGES_LARGE = 128
+_EMBED_LARGE_DOC_PAGES = 256
+_EMBED_BATCH_WAIT = 0.2
+# A document whose pages carry printed page numbers is ordered by the cheap
+# page-number strategy and short-circuits the cascade, so embedding it while
+# extracting would be pure waste. Eager embedding starts only once this
+# fraction of pages has streamed past without a detectable number - i.e.
+# once the page-number strategy can no longer clear its confidence bar.
+_EMBED_SKIP_UNNUMBERED = 0.2
+
+async def _extract_and_embed(pdf_path: str):
+    """Overlap page extraction (I/O + OCR) with embedding compute.
+
+    A producer thread streams page texts into a bounded queue; batches are
+    embedded as soon as enough pages accumulate instead of after the whole
+    extraction pass, so wall time approaches max(extract, embed) rather
+    than their sum.
+
+    Documents whose pages carry printed page numbers skip embedding here
+    entirely (returning None) - the ordering cascade resolves them without
+    ever reaching the semantic strategy.
+    """
+    n_pages = await asyncio.to_thread(pdf_page_count, pdf_path)
+    batch_pages = (
+        _EMBED_BATCH_PAGES_LARGE if n_pages >= _EMBED_LARGE_DOC_PAGES
+        else _EMBED_BATCH_PAGES
+    )
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=8)
+
+    # Set when the consumer gives up (embed failure, client disconnect); the
+    # producer checks it so it can't stay blocked on a full queue forever,
+    # which would permanently eat a thread of the shared to_thread executor
+    stop = threading.Event()
+
+    def _put_sentinel():
+        try:
+            queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+    def _put(text) -> bool:
+        fut = asyncio.run_coroutine_threadsafe(queue.put(text), loop)
+        while True:
+            try:
+                fut.result(timeout=_EMBED_BATCH_WAIT)
+                return True
+            except concurrent.futures.TimeoutError:
+                if stop.is_set():
+                    fut.cancel()
+                    return False
+
+    def _produce():
+        try:
+            for text in extract_texts_from_pdf_path_iter(pdf_path):
+                if stop.is_set() or not _put(text):
+                    return
+        finally:
+            # Non-blocking: the consumer may already be gone, and it only
+            # waits for the sentinel on the happy path
+            loop.call_soon_threadsafe(_put_sentinel)
+
+    producer = asyncio.create_task(asyncio.to_thread(_produce))
+
+    page_texts: List[str] = []
+    batch: List[str] = []
+    # Allocated on the first embedded batch (when the dim is known); batches
+    # write straight into their rows, avoiding a list of parts plus a vstack
+    embeddings: Optional[np.ndarray] = None
+    embedded_rows = 0
+
+    async def _flush_batch():
+        nonlocal embeddings, embedded_rows
+        if batch:
+            part = await asyncio.to_thread(orchestrator.embed_pages, list(batch))
+            if part is not None:
+                if embeddings is None:
+                    embeddings = np.empty((n_pages, part.shape[1]), dtype=np.float32)
+                embeddings[embedded_rows:embedded_rows + len(part)] = part
+                embedded_rows += len(part)
+            batch.clear()
+
+    # Embedding stays off while every streamed page still looks numbered;
+    # it kicks in (catching up on the backlog) the moment enough unnumbered
+    # pages rule the page-number short-circuit out
+    embed_active = False
+    unnumbered = 0
+
+    finished = False
+    try:
+        while not finished:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=_EMBED_BATCH_WAIT)
+            except asyncio.TimeoutError:
+                # Extraction is stalled (likely OCR) - embed what we already have
+                await _flush_batch()
+                continue
+            if item is None:
+                finished = True
+            else:
+                page_texts.append(item)
+                if embed_active:
+                    batch.append(item)
+                else:
+                    if not orchestrator.page_number_strategy.page_has_number(item, n_pages):
+                        unnumbered += 1
+                    if unnumbered > n_pages * _EMBED_SKIP_UNNUMBERED:
+                        embed_active = True
+                        batch.extend(page_texts)
+                if len(batch) >= batch_pages:
+                    await _flush_batch()
+        await _flush_batch()
+    finally:
+        # On error or cancellation the producer may be blocked on the full
+        # queue: signal it to stop, drain so its pending put completes, and
+        # wait for the thread so it can't outlive the request
+        stop.set()
+        if not finished:
+            while True:
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+        await producer
+
+    if embeddings is None or embedded_rows != len(page_texts):
+        return page_texts, None
+    return page_texts, embeddings[:embedded_rows]
+
+def _persist_output(save_path: str, pdf_bytes: bytes, result: Dict[str, Any]) -> str:
+    """Write the reordered PDF and its metadata; returns the metadata path."""
+    save_dir = os.path.dirname(save_path)
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
+    with open(save_path, "wb") as f:
+        f.write(pdf_bytes)
+    metadata_path = save_path.replace(".pdf", "_metadata.json")
+    with open(metadata_path, "w") as f:
+        json.dump(result, f, indent=2)
+    return metadata_path
+
+def _write_temp_pdf(pdf_bytes: bytes) -> str:
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+    tmp.write(pdf_bytes)
+    tmp.flush()
+    tmp.close()
+    return tmp.name
+
+def _write_debug_json(result: Dict[str, Any]):
+    with open("ordering_debug.json", "w") as f:
+        json.dump({
+            "final_order": result["final_order"],
+            "confidences": result["confidences"],
+            "avg_confidence": result["avg_confidence"]
+        }, f, indent=2)
+
 @app.post("/reconstruct")
 async def reconstruct_pdf(
     file: UploadFile = File(...),
     disposition: str = Query("inline", enum=["inline", "attachment"]),
-    save_path: Optional[str] = Form(None)
+    save_path: Optional[str] = Form(None),
+    debug: bool = Query(False)
 ):
     # Create log capture
     log_capture = LogCapture()
     
+    upload_path = None
+
     # Redirect stdout and stderr to our capture
     with redirect_stdout(log_capture), redirect_stderr(log_capture):
         try:
             if not file.filename.lower().endswith(".pdf"):
                 rich_print("[red]Only PDF files accepted[/red]")
                 raise HTTPException(status_code=400, detail="Only PDF files accepted")
-            
-            raw = await file.read()
-            if not raw:
+
+            # Stream the upload to disk in 1 MB chunks instead of buffering the
+            # whole PDF in memory alongside the parsed document structures
+            upload_tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+            upload_path = upload_tmp.name
+            upload_size = 0
+            while chunk := await file.read(1 << 20):
+                upload_tmp.write(chunk)
+                upload_size += len(chunk)
+            upload_tmp.close()
+
+            if not upload_size:
                 rich_print("[red]Empty file uploaded[/red]")
                 raise HTTPException(status_code=400, detail="Empty file uploaded")
-            
-            # Extract page texts (OCR fallback included)
+
+            # Extract page texts (OCR fallback included), embedding batches of
+            # pages while later pages are still being extracted
             rich_print("[blue]Extracting texts from PDF...[/blue]")
-            page_texts = extract_texts_from_pdf_bytes(raw)
-            
+            page_texts, page_embeddings = await _extract_and_embed(upload_path)
+
             rich_print(f"[green]Extracted {len(page_texts)} pages[/green]")
-            
-            # Get ordering from orchestrator (this will print all the strategy logs)
-            final_order, final_confidences = orchestrator.get_order(page_texts)
+
+            # Get ordering from orchestrator (this will print all the strategy logs).
+            # Runs on a worker thread: embedding inference and the Gemini call are
+            # synchronous and would otherwise stall every other request on the loop.
+            final_order, final_confidences = await asyncio.to_thread(
+                orchestrator.get_order, page_texts, page_embeddings
+            )
 
             # Rebuild reordered PDF
             rich_print("[blue]Rebuilding PDF with new order...[/blue]")
-            reordered_bytes = reorder_pdf_bytes(raw, final_order)
+            reordered_bytes = reorder_pdf_path(upload_path, final_order)
             
             rich_print(f"[green]✓ PDF reconstruction complete[/green]")
             rich_print(f"[green]  Original order: [0, 1, 2, ..., {len(page_texts)-1}][/green]")
             rich_print(f"[green]  Final order: {final_order}[/green]")
             
             # Prepare result metadata
+            request_id = uuid.uuid4().hex
             result = {
+                "request_id": request_id,
                 "original_filename": file.filename,
                 "page_count": len(page_texts),
                 "final_order": final_order,
@@ -131,14 +369,11 @@ async def reconstruct_pdf(
                 "avg_confidence": sum(final_confidences) / len(final_confidences) if final_confidences else 0.0,
             }
             
-            # Debug logging
-            with open("ordering_debug.json", "w") as f:
-                json.dump({
-                    "final_order": final_order,
-                    "confidences": final_confidences,
-                    "avg_confidence": result["avg_confidence"]
-                }, f, indent=2)
-            
+            # Debug logging (opt-in; keeps a disk write off the hot path)
+            if debug:
+                await asyncio.to_thread(_write_debug_json, result)
+
+
             # Get all captured logs
             log_capture.flush()  # Flush any remaining buffer
             all_logs = log_capture.logs
@@ -149,28 +384,20 @@ async def reconstruct_pdf(
             if save_path:
                 rich_print(f"[blue]💾 Saving to custom location: {save_path}[/blue]")
                 
-                # Ensure directory exists
-                save_dir = os.path.dirname(save_path)
-                if save_dir:
-                    os.makedirs(save_dir, exist_ok=True)
-                    rich_print(f"[blue]📁 Directory verified: {save_dir}[/blue]")
-                
-                # Write PDF to custom location
-                with open(save_path, "wb") as f:
-                    f.write(reordered_bytes)
+                # Write PDF + metadata on a worker thread so disk I/O doesn't
+                # block the event loop
+                metadata_path = await asyncio.to_thread(
+                    _persist_output, save_path, reordered_bytes, result
+                )
                 rich_print("[green]✅ File saved successfully![/green]")
-                
-                # Also save metadata alongside
-                metadata_path = save_path.replace(".pdf", "_metadata.json")
-                with open(metadata_path, "w") as f:
-                    json.dump(result, f, indent=2)
                 rich_print(f"[blue]📄 Metadata saved to: {metadata_path}[/blue]")
-                
+
                 # Get final logs including save operations
                 log_capture.flush()
                 all_logs = log_capture.logs
                 
                 # Return JSON response with logs
+                _store_logs(request_id, all_logs)
                 return JSONResponse(
                     content={
                         "status": "success",
@@ -178,35 +405,29 @@ async def reconstruct_pdf(
                         "metadata_path": metadata_path,
                         "logs": all_logs,
                         "result": result
-                    },
-                    headers={
-                        "X-Backend-Logs": quote(json.dumps(all_logs))
                     }
                 )
             else:
                 # Return file for browser download
-                # Save temporary file
-                tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-                tmp.write(reordered_bytes)
-                tmp.flush()
-                tmp.close()
-
-                # Write metadata to temp file
-                log_tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".json", mode="w")
-                json.dump(result, log_tmp, indent=2)
-                log_tmp.flush()
-                log_tmp.close()
-                
+                tmp_path = await asyncio.to_thread(_write_temp_pdf, reordered_bytes)
+
                 content_disposition = f'{disposition}; filename="reconstructed_{file.filename}"'
-                
-                return StreamingResponse(
-                    open(tmp.name, "rb"),
+
+                # Logs go through GET /logs/{request_id} rather than a header:
+                # URL-encoded JSON in X-Backend-Logs easily blew past the 8 KB
+                # header limits of common proxies
+                _store_logs(request_id, all_logs)
+
+                # FileResponse serves via sendfile(2) - no user-space copy loop -
+                # and the background task cleans the temp file up after the send
+                return FileResponse(
+                    tmp_path,
                     media_type="application/pdf",
                     headers={
                         "X-Result-Meta": json.dumps(result),
-                        "X-Backend-Logs": quote(json.dumps(all_logs)),
                         "Content-Disposition": content_disposition
-                    }
+                    },
+                    background=BackgroundTask(os.unlink, tmp_path)
                 )
         
         except HTTPException:
@@ -216,6 +437,30 @@ async def reconstruct_pdf(
             import traceback
             traceback.print_exc()
             raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+        finally:
+            if upload_path:
+                try:
+                    os.unlink(upload_path)
+                except OSError:
+                    pass
+
+@app.get("/logs/{request_id}")
+async def get_logs(request_id: str, request: Request):
+    logs = _load_logs(request_id)
+    if logs is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired request id")
+    body = json.dumps({"request_id": request_id, "logs": logs}).encode("utf-8")
+    # Log text is highly redundant; gzip typically shrinks it 5-10x. Done
+    # here rather than via app-wide GZipMiddleware, which would also
+    # recompress the already-deflated PDF downloads and break their
+    # sendfile(2) path
+    if "gzip" in request.headers.get("accept-encoding", "") and len(body) >= 1024:
+        return Response(
+            content=gzip.compress(body, compresslevel=6),
+            media_type="application/json",
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+        )
+    return Response(content=body, media_type="application/json")
 
 @app.get("/")
 async def health():
@@ -225,5 +470,20 @@ if __name__ == "__main__":
     print("🚀 Starting PDF Reconstruction Server")
     print("📍 Server: http://localhost:8000")
     print("📝 All terminal output will be captured and sent to frontend")
+    if _WORKERS > 1 and shutil.which("gunicorn"):
+        import torch
+        # --preload loads the embedding model once in the master; forked
+        # workers then share the read-only weights copy-on-write instead of
+        # each paying the load time and RAM for its own copy. CUDA contexts
+        # cannot be re-initialized in a forked subprocess, though, so on GPU
+        # hosts each worker must import the app (and place the model) itself
+        preload = [] if torch.cuda.is_available() else ["--preload"]
+        os.execvp("gunicorn", [
+            "gunicorn", "app:app",
+            "-k", "uvicorn.workers.UvicornWorker",
+            "-w", str(_WORKERS),
+            *preload,
+            "--bind", "0.0.0.0:8000",
+        ])
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
 
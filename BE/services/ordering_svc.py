@@ -1,12 +1,37 @@
 # ordering_svc.py
 import numpy as np
 from typing import List, Tuple
+from functools import lru_cache
 import os
 from rich import print
 import json
 import google.generativeai as genai
 from sentence_transformers import SentenceTransformer
 
+
+@lru_cache(maxsize=4)
+def _get_model(model_name: str) -> SentenceTransformer:
+    """Load a SentenceTransformer once per process; repeat Orchestrator
+    constructions (tests, reloads) reuse the cached weights instead of paying
+    the torch.load + tokenizer init again.
+
+    Set EMBEDDING_BACKEND=onnx to run inference through ONNX Runtime
+    (requires `pip install sentence-transformers[onnx]`); EMBEDDING_ONNX_FILE
+    can point at a quantized export, e.g. onnx/model_qint8_avx512_vnni.onnx,
+    for int8 inference on CPU-only hosts."""
+    if os.getenv("EMBEDDING_BACKEND", "torch").lower() == "onnx":
+        try:
+            kwargs = {}
+            onnx_file = os.getenv("EMBEDDING_ONNX_FILE")
+            if onnx_file:
+                kwargs["model_kwargs"] = {"file_name": onnx_file}
+            model = SentenceTransformer(model_name, backend="onnx", **kwargs)
+            print("[green]Embedding model running on the ONNX Runtime backend[/green]")
+            return model
+        except Exception as e:
+            print(f"[yellow]ONNX backend unavailable ({e}); falling back to torch[/yellow]")
+    return SentenceTransformer(model_name)
+
 from .strategies import (
     PageNumberStrategy,
     ConfigurableBusinessLogicStrategy,
@@ -25,6 +50,11 @@ class Orchestrator:
         self._setup_embedding_model(model_name)
 
         self.strategies = self._initialize_strategies()
+        # After strategy construction: SemanticSimilarityStrategy moves the
+        # model to its final device/precision (CUDA fp16 when available), and
+        # warming up any earlier would exercise the CPU copy while leaving
+        # CUDA context creation and kernel compilation for the first request
+        self._warmup_embedding_model()
 
     def _setup_gemini(self):
         api_key = os.getenv("GEMINI_API_KEY")
@@ -40,36 +70,80 @@ class Orchestrator:
 
     def _setup_embedding_model(self, model_name: str):
         try:
-            self.embedding_model = SentenceTransformer(model_name)
+            self.embedding_model = _get_model(model_name)
             print(f"[green]Embedding model '{model_name}' loaded[/green]")
         except Exception as e:
             print(f"[red]Failed to load embedding model: {e}[/red]")
 
+    def _warmup_embedding_model(self):
+        """Warmup forward pass: pays tokenizer init, CUDA context creation and
+        kernel compilation at startup instead of inside the first request,
+        which otherwise shows up as multi-second tail latency."""
+        if self.embedding_model is None:
+            return
+        try:
+            self.semantic_strategy.embed_pages(["warmup " * 8])
+            print("[green]Embedding model warmed up[/green]")
+        except Exception as e:
+            print(f"[yellow]Embedding warmup failed: {e}[/yellow]")
+
     def _initialize_strategies(self) -> List:
+        self.semantic_strategy = SemanticSimilarityStrategy(self.embedding_model)
+        self.page_number_strategy = PageNumberStrategy()
         return [
-            PageNumberStrategy(),
+            self.page_number_strategy,
             ConfigurableBusinessLogicStrategy(),
             StructuralPatternStrategy(),
-            SemanticSimilarityStrategy(self.embedding_model),
+            self.semantic_strategy,
             DateSequenceStrategy(),
             LLMReasoningStrategy(self.gemini_model),
         ]
 
-    def get_order(self, page_texts: List[str]) -> Tuple[List[int], List[float]]:
+    def embed_pages(self, page_texts: List[str]):
+        """Embed a batch of page texts through the semantic strategy's encoder.
+
+        Lets callers compute embeddings incrementally (e.g. while extraction is
+        still running) and hand them to get_order afterwards.
+        """
+        if self.embedding_model is None:
+            return None
+        return self.semantic_strategy.embed_pages(page_texts)
+
+    def get_order(self, page_texts: List[str], embeddings=None) -> Tuple[List[int], List[float]]:
         n_pages = len(page_texts)
         if n_pages == 0:
             return [], []
 
-        page_contents = [{ "page_index": i, "content": text } for i, text in enumerate(page_texts)]
+        # Case-fold once per page here; several strategies scan the lowered
+        # text and each was paying for its own .lower() pass
+        page_contents = [
+            { "page_index": i, "content": text, "content_lower": text.lower() }
+            for i, text in enumerate(page_texts)
+        ]
 
         strategy_results: List[OrderingResult] = []
         for strategy in self.strategies:
             if strategy.can_handle(page_contents):
-                result = strategy.attempt_ordering(page_contents)
+                if strategy is self.semantic_strategy:
+                    # Embeddings travel as a call argument: the strategy
+                    # instance is shared across concurrent requests, so
+                    # stashing them on it would let one request's pages be
+                    # ordered with another's vectors
+                    result = strategy.attempt_ordering(
+                        page_contents, precomputed_embeddings=embeddings
+                    )
+                else:
+                    result = strategy.attempt_ordering(page_contents)
                 strategy_results.append(result)
                 print(f"[cyan]Strategy '{strategy.name}' completed with confidence {result.confidence:.2f}[/cyan]")
                 for reason in result.reasoning:
                     print(f"  - {reason}")
+                # Strategies are ordered cheapest first; once one clears
+                # both its own threshold and a high absolute bar there is
+                # no point paying for embeddings or an LLM round trip
+                if result.confidence >= max(strategy.threshold, 0.8):
+                    print(f"[green]'{strategy.name}' is confident - skipping remaining strategies[/green]")
+                    break
 
         if not strategy_results:
             print("[red]No strategy could determine an order. Falling back to default.[/red]")
@@ -84,8 +158,19 @@ class Orchestrator:
 
         # Ensure the order is valid
         if len(final_order) != n_pages or len(set(final_order)) != n_pages:
-            print("[red]Winning strategy produced an invalid order. Falling back to default.[/red]")
-            final_order = list(range(n_pages))
+            is_partial = (
+                len(set(final_order)) == len(final_order)
+                and all(0 <= i < n_pages for i in final_order)
+            )
+            if is_partial and final_order:
+                # Distinct, in-range, but incomplete: place the missing pages
+                # where they fit best semantically instead of discarding the
+                # strategy's work
+                print("[yellow]Winning strategy missed some pages. Inserting them by semantic fit.[/yellow]")
+                final_order = self.semantic_strategy.insert_missing_pages(final_order, page_texts)
+            else:
+                print("[red]Winning strategy produced an invalid order. Falling back to default.[/red]")
+                final_order = list(range(n_pages))
 
         # Dummy confidences for now
         confidences = [best_result.confidence] * n_pages
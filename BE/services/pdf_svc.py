@@ -1,19 +1,70 @@
 # pdf_svc.py
-from PyPDF2 import PdfReader, PdfWriter
-from typing import List
-import io
+from typing import List, Optional, Union
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+import hashlib
+import json
+import os
+import tempfile
 import fitz  # PyMuPDF
 from rich import print
-from .ocr_svc import ocr_page
+from .ocr_svc import ocr_page, ocr_pages
+
+# Below this many OCR pages, process-pool startup costs more than it saves
+_OCR_POOL_MIN_PAGES = 8
+
+# Extracted page texts cached on a hash of the PDF content, so repeat uploads
+# of the same file skip parsing and OCR entirely. Bounded: least-recently-
+# written entries past the cap are pruned on each write.
+_TEXT_CACHE_DIR = Path(tempfile.gettempdir()) / "pdf_text_cache"
+_TEXT_CACHE_MAX = 256
+
+def _pdf_bytes_key(pdf_bytes: bytes) -> str:
+    return hashlib.blake2b(pdf_bytes, digest_size=16).hexdigest()
+
+def _pdf_file_key(pdf_path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(pdf_path, "rb") as fh:
+        while chunk := fh.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _texts_cache_get(key: str) -> Optional[List[str]]:
+    try:
+        path = _TEXT_CACHE_DIR / f"{key}.texts.json"
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except Exception:
+        pass
+    return None
+
+def _texts_cache_put(key: str, texts: List[str]):
+    try:
+        _TEXT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(_TEXT_CACHE_DIR / f"{key}.texts.json", "w", encoding="utf-8") as f:
+            json.dump(texts, f)
+        for stale in sorted(_TEXT_CACHE_DIR.glob("*.texts.json"), key=os.path.getmtime)[:-_TEXT_CACHE_MAX]:
+            os.unlink(stale)
+    except Exception:
+        pass
+
+def _reorder(doc, page_order: List[int]) -> bytes:
+    # select() permutes pages on the already-parsed MuPDF object graph; no
+    # second parse, no per-page re-serialization like the old PyPDF2 writer
+    try:
+        doc.select(page_order)
+        return doc.tobytes(deflate=True, garbage=3)
+    finally:
+        doc.close()
 
 def reorder_pdf_bytes(input_bytes: bytes, page_order: List[int]) -> bytes:
-    reader = PdfReader(io.BytesIO(input_bytes))
-    writer = PdfWriter()
-    for idx in page_order:
-        writer.add_page(reader.pages[idx])
-    out = io.BytesIO()
-    writer.write(out)
-    return out.getvalue()
+    return _reorder(fitz.open(stream=input_bytes, filetype="pdf"), page_order)
+
+def reorder_pdf_path(input_path: str, page_order: List[int]) -> bytes:
+    """Reorder a PDF read from disk, avoiding a whole-file copy in memory."""
+    return _reorder(fitz.open(input_path), page_order)
 
 def extract_text_from_page(page) -> str:
     """Try to extract text natively from the page; if empty, try OCR on the page image."""
@@ -24,13 +75,121 @@ def extract_text_from_page(page) -> str:
     # Fallback: render page to an image and OCR
     return ocr_page(page)
 
-def extract_texts_from_pdf_bytes(pdf_bytes: bytes) -> List[str]:
-    """Return list of page texts in order of stored pages (shuffled input expected)."""
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    pages_texts = []
+def _ocr_pages_worker(pdf_src: Union[str, bytes], page_indices: List[int]) -> List[str]:
+    """Top-level so ProcessPoolExecutor can pickle it. fitz Documents are not
+    picklable, so each worker reopens the PDF from its path or raw bytes."""
+    if isinstance(pdf_src, str):
+        doc = fitz.open(pdf_src)
+    else:
+        doc = fitz.open(stream=pdf_src, filetype="pdf")
+    try:
+        return ocr_pages(doc, page_indices)
+    finally:
+        doc.close()
+
+def _ocr_many(doc, pdf_src: Optional[Union[str, bytes]], ocr_needed: List[int]) -> List[str]:
+    """OCR the given pages, spreading big batches over a process pool.
+
+    OCR is CPU-bound and embarrassingly parallel across pages; native text
+    extraction stays in the caller's process because it is already fast.
+    """
+    workers = min(os.cpu_count() or 1, len(ocr_needed))
+    if pdf_src is None or workers < 2 or len(ocr_needed) < _OCR_POOL_MIN_PAGES:
+        return ocr_pages(doc, ocr_needed)
+
+    chunks = [ocr_needed[i::workers] for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_ocr_pages_worker, repeat(pdf_src), chunks)
+
+    by_index = {}
+    for chunk, texts in zip(chunks, results):
+        by_index.update(zip(chunk, texts))
+    return [by_index[i] for i in ocr_needed]
+
+def _extract_texts(doc, pdf_src: Optional[Union[str, bytes]] = None) -> List[str]:
+    pages_texts = [""] * doc.page_count
+    ocr_needed = []
     for i in range(doc.page_count):
-        page = doc.load_page(i)
-        txt = extract_text_from_page(page)
-        pages_texts.append(txt)
+        txt = doc.load_page(i).get_text("text")
+        if txt and txt.strip():
+            pages_texts[i] = txt.strip()
+        else:
+            ocr_needed.append(i)
+
+    # Image-only pages are OCRed in batches (parallelized when there are
+    # enough of them) instead of a subprocess per page
+    if ocr_needed:
+        for i, txt in zip(ocr_needed, _ocr_many(doc, pdf_src, ocr_needed)):
+            pages_texts[i] = txt
+
     doc.close()
     return pages_texts
+
+def extract_texts_from_pdf_bytes(pdf_bytes: bytes) -> List[str]:
+    """Return list of page texts in order of stored pages (shuffled input expected)."""
+    key = _pdf_bytes_key(pdf_bytes)
+    cached = _texts_cache_get(key)
+    if cached is not None:
+        print("[green]Using cached page texts[/green]")
+        return cached
+    texts = _extract_texts(fitz.open(stream=pdf_bytes, filetype="pdf"), pdf_src=pdf_bytes)
+    _texts_cache_put(key, texts)
+    return texts
+
+def extract_texts_from_pdf_path(pdf_path: str) -> List[str]:
+    """Same as extract_texts_from_pdf_bytes but reads straight from disk."""
+    key = _pdf_file_key(pdf_path)
+    cached = _texts_cache_get(key)
+    if cached is not None:
+        print("[green]Using cached page texts[/green]")
+        return cached
+    texts = _extract_texts(fitz.open(pdf_path), pdf_src=pdf_path)
+    _texts_cache_put(key, texts)
+    return texts
+
+def pdf_page_count(pdf_path: str) -> int:
+    doc = fitz.open(pdf_path)
+    try:
+        return doc.page_count
+    finally:
+        doc.close()
+
+def extract_texts_from_pdf_path_iter(pdf_path: str):
+    """Yield page texts one by one so callers can overlap extraction with
+    downstream work (e.g. embedding) instead of waiting for the whole pass.
+
+    Native text is pulled for all pages first; image-only gaps then go
+    through the same batched (and, for big batches, pooled) OCR pass as the
+    non-streaming extractors rather than one Tesseract subprocess per page.
+    """
+    key = _pdf_file_key(pdf_path)
+    cached = _texts_cache_get(key)
+    if cached is not None:
+        print("[green]Using cached page texts[/green]")
+        yield from cached
+        return
+
+    doc = fitz.open(pdf_path)
+    try:
+        texts = [""] * doc.page_count
+        ocr_needed = []
+        for i in range(doc.page_count):
+            txt = doc.load_page(i).get_text("text")
+            if txt and txt.strip():
+                texts[i] = txt.strip()
+            else:
+                ocr_needed.append(i)
+
+        # Everything before the first OCR gap can stream immediately; the
+        # gaps are filled in one batch before yielding resumes, since pages
+        # must come out in order anyway
+        first_gap = ocr_needed[0] if ocr_needed else doc.page_count
+        yield from texts[:first_gap]
+        if ocr_needed:
+            for i, txt in zip(ocr_needed, _ocr_many(doc, pdf_path, ocr_needed)):
+                texts[i] = txt
+            yield from texts[first_gap:]
+    finally:
+        doc.close()
+    # Only reached when the document was fully consumed without error
+    _texts_cache_put(key, texts)
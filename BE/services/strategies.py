@@ -5,15 +5,81 @@ from typing import List, Dict, Tuple, Optional
 import re
 import json
 import os
+import hashlib
+import tempfile
 from pathlib import Path
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.cluster import KMeans
 from datetime import datetime
 from dateutil import parser
+import torch
 import google.generativeai as genai
 from sentence_transformers import SentenceTransformer
 
+try:
+    from python_tsp.exact import solve_tsp_dynamic_programming
+    from python_tsp.heuristics import solve_tsp_lin_kernighan
+except ImportError:  # optional accelerator; greedy path still works without it
+    solve_tsp_dynamic_programming = None
+    solve_tsp_lin_kernighan = None
+
+try:
+    import simsimd
+except ImportError:  # optional SIMD kernels; BLAS matmul path covers the rest
+    simsimd = None
+
+try:
+    import orjson
+except ImportError:  # optional; stdlib json parses the same payloads
+    orjson = None
+
+
+def _loads(payload: str):
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+# Page-embedding cache keyed on a content hash of the cleaned text. The
+# in-memory dict serves repeat pages within a process; the on-disk copy
+# survives --reload restarts, which re-run the whole pipeline otherwise.
+_EMB_CACHE: Dict[str, np.ndarray] = {}
+_EMB_CACHE_MAX = 4096
+_EMB_CACHE_DIR = Path(tempfile.gettempdir()) / "pdf_emb_cache"
+_EMB_CACHE_DISK_MAX = 4096
+
+
+def _embedding_cache_get(key: str) -> Optional[np.ndarray]:
+    vec = _EMB_CACHE.get(key)
+    if vec is not None:
+        return vec
+    path = _EMB_CACHE_DIR / f"{key}.npy"
+    try:
+        if path.exists():
+            vec = np.load(path)
+            _EMB_CACHE[key] = vec
+            return vec
+    except Exception:
+        pass
+    return None
+
+
+def _embedding_cache_put(key: str, vec: np.ndarray):
+    # Oldest-first eviction (dicts iterate in insertion order); wiping the
+    # whole cache on overflow would throw away a document's own earlier
+    # pages while it is still being processed
+    while len(_EMB_CACHE) >= _EMB_CACHE_MAX:
+        _EMB_CACHE.pop(next(iter(_EMB_CACHE)))
+    _EMB_CACHE[key] = vec
+    try:
+        _EMB_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        np.save(_EMB_CACHE_DIR / f"{key}.npy", vec)
+        # Keep the directory bounded too: prune least-recently-written
+        # entries past the cap, like the app's log store does
+        for stale in sorted(_EMB_CACHE_DIR.glob("*.npy"), key=os.path.getmtime)[:-_EMB_CACHE_DISK_MAX]:
+            os.unlink(stale)
+    except Exception:
+        pass
+
 
 class OrderingResult:
     def __init__(self, order: List[int], confidence: float, reasoning: List[str], 
@@ -38,11 +104,34 @@ class BaseOrderingStrategy(ABC):
         return True
 
 class PageNumberStrategy(BaseOrderingStrategy):
+    # Fallback/document-specific patterns tried after the configured ones
+    _EXTRA_PATTERNS = [
+        r'-(\d+)-',           # IREDA specific: -7-, -20-
+        r'—(\d+)—',           # Em dash variant
+        r'–(\d+)–',           # En dash variant
+        r'- (\d+) -',         # With spaces
+        r'^\s*-(\d+)-\s*$',   # Line with just page number
+        r'page\s+(\d+)',      # Standard page notation
+        r'(\d+)\s+of\s+\d+',  # X of Y format
+        r'^\s*(\d+)\s*$',     # Just a number on its line
+        r'p\.?\s*(\d+)'       # p.7 or p 7
+    ]
+
     def __init__(self):
         super().__init__(threshold=0.8)
         # Load patterns from config if available
         self.config = self._load_page_number_patterns()
-    
+        # Compile once up front; the old code rebuilt the pattern list per
+        # page and validated each regex on every findall
+        self._compiled_patterns = []
+        for pattern in self.config + self._EXTRA_PATTERNS:
+            try:
+                self._compiled_patterns.append(
+                    (pattern, re.compile(pattern, re.MULTILINE | re.IGNORECASE))
+                )
+            except re.error as e:
+                print(f"Invalid regex pattern '{pattern}': {e}")
+
     def _load_page_number_patterns(self) -> List[str]:
         config_path = Path(__file__).parent / "document_rules.json"    
         try:        
@@ -59,53 +148,49 @@ class PageNumberStrategy(BaseOrderingStrategy):
                 r'p\.?\s*(\d+)'
                 ]
 
+    def page_has_number(self, content: str, n_pages: int) -> bool:
+        """Cheap single-page probe: does this page carry a plausible printed
+        page number? Lets callers upstream predict whether this strategy will
+        cover the document (and e.g. skip eager embedding) without running
+        the full ordering pass."""
+        for _, compiled in self._compiled_patterns:
+            for match in compiled.findall(content):
+                try:
+                    if 1 <= int(match) <= n_pages * 2:
+                        return True
+                except ValueError:
+                    continue
+        return False
+
     def attempt_ordering(self, page_contents: List[Dict]) -> OrderingResult:
         page_numbers = {}
         pattern_matches = {}  # Track which pattern worked for each page
         
-        print(f"\nTesting page number detection with {len(self.config)} patterns...")
-        
+        print(f"\nTesting page number detection with {len(self._compiled_patterns)} patterns...")
+
         for i, page in enumerate(page_contents):
             content = page['content']
-            
-            # Try patterns from config first, then fallback patterns
-            all_patterns = self.config + [
-                r'-(\d+)-',           # IREDA specific: -7-, -20-
-                r'—(\d+)—',           # Em dash variant
-                r'–(\d+)–',           # En dash variant  
-                r'- (\d+) -',         # With spaces
-                r'^\s*-(\d+)-\s*$',   # Line with just page number
-                r'page\s+(\d+)',      # Standard page notation
-                r'(\d+)\s+of\s+\d+',  # X of Y format
-                r'^\s*(\d+)\s*$',     # Just a number on its line
-                r'p\.?\s*(\d+)'      # p.7 or p 7
-            ]
-            
-            for pattern_idx, pattern in enumerate(all_patterns):
-                try:
-                    matches = re.findall(pattern, content, re.MULTILINE | re.IGNORECASE)
-                    if matches:
-                        for match in matches:
-                            try:
-                                page_num = int(match)
-                                # Reasonable range check (allow for some missing pages)
-                                if 1 <= page_num <= len(page_contents) * 2:
-                                    if i not in page_numbers or page_num < page_numbers[i]:
-                                        page_numbers[i] = page_num
-                                        pattern_matches[i] = {
-                                            'pattern': pattern,
-                                            'match': match,
-                                            'full_text_sample': content[:100]
-                                        }
-                                        print(f"Page {i+1}: Found page number {page_num} using pattern '{pattern}'")
-                                        break
-                            except ValueError:
-                                continue
-                    if i in page_numbers:
-                        break  # Found a match, move to next page
-                except re.error as e:
-                    print(f"Invalid regex pattern '{pattern}': {e}")
-                    continue
+
+            # Config patterns first, then fallbacks - all precompiled
+            for pattern, compiled in self._compiled_patterns:
+                for match in compiled.findall(content):
+                    try:
+                        page_num = int(match)
+                    except ValueError:
+                        continue
+                    # Reasonable range check (allow for some missing pages)
+                    if 1 <= page_num <= len(page_contents) * 2:
+                        if i not in page_numbers or page_num < page_numbers[i]:
+                            page_numbers[i] = page_num
+                            pattern_matches[i] = {
+                                'pattern': pattern,
+                                'match': match,
+                                'full_text_sample': content[:100]
+                            }
+                            print(f"Page {i+1}: Found page number {page_num} using pattern '{pattern}'")
+                            break
+                if i in page_numbers:
+                    break  # Found a match, move to next page
         
         print(f"Successfully detected page numbers for {len(page_numbers)}/{len(page_contents)} pages")
         
@@ -167,7 +252,32 @@ class ConfigurableBusinessLogicStrategy(BaseOrderingStrategy):
     def __init__(self):
         super().__init__(threshold=0.6)
         self.document_config = self._load_document_config()
-    
+        self._prepared_types = self._prepare_sections()
+
+    def _prepare_sections(self) -> Dict[str, List[Dict]]:
+        """Lowercase indicator phrases and compile boost regexes once at load
+        time; the scoring loops previously re-lowered every string and
+        re-compiled every pattern per page on every request."""
+        prepared = {}
+        for doc_type, config in self.document_config.get("document_types", {}).items():
+            sections = []
+            for section in config["sections"]:
+                compiled = []
+                for pattern in section.get("boost_patterns", []):
+                    try:
+                        compiled.append(re.compile(pattern.lower()))
+                    except re.error:
+                        print(f"Invalid regex pattern: {pattern}")
+                sections.append({
+                    'section': section,
+                    'weight': section.get("weight", 1.0),
+                    'indicators': [s.lower() for s in section["indicators"]],
+                    'required': [s.lower() for s in section.get("required_any", [])],
+                    'boost': compiled,
+                })
+            prepared[doc_type] = sections
+        return prepared
+
     def _load_document_config(self) -> Dict:
         """Load document configuration from JSON file"""
         config_path = Path(__file__).parent / "document_rules.json"
@@ -180,35 +290,35 @@ class ConfigurableBusinessLogicStrategy(BaseOrderingStrategy):
     
     def _detect_document_type(self, page_contents: List[Dict]) -> str:
         """Automatically detect document type based on content analysis"""
-        combined_text = " ".join([page['content'].lower() for page in page_contents])
+        combined_text = " ".join([
+            page.get('content_lower') or page['content'].lower()
+            for page in page_contents
+        ])
         
         doc_scores = {}
-        for doc_type, config in self.document_config.get("document_types", {}).items():
+        for doc_type, sections in self._prepared_types.items():
             score = 0
             total_possible_score = 0
-            
-            for section in config["sections"]:
-                section_weight = section.get("weight", 1.0)
+
+            for prep in sections:
+                section_weight = prep['weight']
                 total_possible_score += section_weight
-                
+
                 # Check indicators
-                for indicator in section["indicators"]:
-                    if indicator.lower() in combined_text:
+                for indicator in prep['indicators']:
+                    if indicator in combined_text:
                         score += section_weight * 0.5
-                
+
                 # Check required_any patterns
-                for required in section.get("required_any", []):
-                    if required.lower() in combined_text:
+                for required in prep['required']:
+                    if required in combined_text:
                         score += section_weight * 0.3
-                
+
                 # Check boost patterns (regex)
-                for pattern in section.get("boost_patterns", []):
-                    try:
-                        if re.search(pattern.lower(), combined_text):
-                            score += section_weight * 1.0
-                    except re.error:
-                        continue
-            
+                for pattern in prep['boost']:
+                    if pattern.search(combined_text):
+                        score += section_weight * 1.0
+
             # Normalize score
             if total_possible_score > 0:
                 normalized_score = score / total_possible_score
@@ -244,37 +354,35 @@ class ConfigurableBusinessLogicStrategy(BaseOrderingStrategy):
         print(f"\nClassifying pages using {doc_config['name']} rules...")
         
         for i, page in enumerate(page_contents):
-            content_lower = page['content'].lower()
+            content_lower = page.get('content_lower') or page['content'].lower()
             best_match = None
             best_score = 0
             matched_indicators = []
             
-            for section in doc_config["sections"]:
+            for prep in self._prepared_types[doc_type]:
+                section = prep['section']
+                weight = prep['weight']
                 score = 0
                 section_matched_indicators = []
-                
+
                 # Check basic indicators
-                for indicator in section["indicators"]:
-                    if indicator.lower() in content_lower:
-                        score += 1 * section.get("weight", 1.0)
-                        section_matched_indicators.append(indicator)
-                
+                for indicator, original in zip(prep['indicators'], section["indicators"]):
+                    if indicator in content_lower:
+                        score += 1 * weight
+                        section_matched_indicators.append(original)
+
                 # Check required_any patterns
-                for required in section.get("required_any", []):
-                    if required.lower() in content_lower:
-                        score += 2 * section.get("weight", 1.0)
-                        section_matched_indicators.append(f"required: {required}")
-                
+                for required, original in zip(prep['required'], section.get("required_any", [])):
+                    if required in content_lower:
+                        score += 2 * weight
+                        section_matched_indicators.append(f"required: {original}")
+
                 # Check boost patterns (regex patterns for stronger matches)
-                for pattern in section.get("boost_patterns", []):
-                    try:
-                        if re.search(pattern.lower(), content_lower):
-                            score += 3 * section.get("weight", 1.0)
-                            section_matched_indicators.append(f"pattern: {pattern}")
-                    except re.error:
-                        print(f"Invalid regex pattern: {pattern}")
-                        continue
-                
+                for pattern in prep['boost']:
+                    if pattern.search(content_lower):
+                        score += 3 * weight
+                        section_matched_indicators.append(f"pattern: {pattern.pattern}")
+
                 # Update best match if this section scores higher
                 if score > best_score:
                     best_score = score
@@ -416,11 +524,261 @@ class StructuralPatternStrategy(BaseOrderingStrategy):
         return priority
 
 class SemanticSimilarityStrategy(BaseOrderingStrategy):
+    # Shared embedding for blank pages: every empty page produces the same
+    # "[empty page]" placeholder, so one forward pass covers all of them
+    _EMPTY_EMB = None
+
+    # Above this many unique pages, pure-Python Lin-Kernighan costs more
+    # than its ordering-quality win; the presorted greedy traversal takes
+    # over as the large-document path
+    _TSP_MAX_PAGES = 128
+
     def __init__(self, embedding_model):
         super().__init__(threshold=0.6)
         self.embedding_model = embedding_model
-    
-    def attempt_ordering(self, page_contents: List[Dict]) -> OrderingResult:
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        if self.embedding_model is not None and self.device == "cuda":
+            # fp16 halves memory bandwidth on GPU with no measurable loss for cosine ranking
+            self.embedding_model = self.embedding_model.half().to(self.device)
+        # Lazily started encode worker pool for large CPU-bound documents
+        self._mp_pool = None
+
+    def embed_pages(self, texts: List[str]) -> np.ndarray:
+        """Public batch-embedding entry point (used for incremental pipelines)."""
+        return self._embed_pages(texts)
+
+    def _embed_pages(self, texts: List[str]) -> np.ndarray:
+        """Embed all page texts in one batched call, returning unit-norm float32 vectors."""
+        texts_clean = [t.strip() if t and t.strip() else "[empty page]" for t in texts]
+        keys = [hashlib.blake2b(t.encode("utf-8"), digest_size=16).hexdigest() for t in texts_clean]
+        vectors = [
+            self._empty_embedding() if t == "[empty page]" else _embedding_cache_get(k)
+            for t, k in zip(texts_clean, keys)
+        ]
+
+        miss_idx = [i for i, v in enumerate(vectors) if v is None]
+        if miss_idx:
+            # Misses are deduplicated on the content hash before hitting the
+            # encoder, so a document full of repeated pages (blank scans,
+            # boilerplate) pays for each distinct page once even on a cold cache
+            unique_keys: Dict[str, int] = {}
+            unique_texts = []
+            for i in miss_idx:
+                if keys[i] not in unique_keys:
+                    unique_keys[keys[i]] = len(unique_texts)
+                    unique_texts.append(texts_clean[i])
+            encoded = self._encode_batch(unique_texts)
+            for i in miss_idx:
+                vec = encoded[unique_keys[keys[i]]]
+                vectors[i] = vec
+                _embedding_cache_put(keys[i], vec)
+
+        return np.stack(vectors).astype(np.float32, copy=False)
+
+    def _empty_embedding(self) -> np.ndarray:
+        if SemanticSimilarityStrategy._EMPTY_EMB is None:
+            SemanticSimilarityStrategy._EMPTY_EMB = self._encode_batch(["[empty page]"])[0]
+        return SemanticSimilarityStrategy._EMPTY_EMB
+
+    def _encode_batch(self, texts_clean: List[str]) -> np.ndarray:
+        """Encode texts, spreading big CPU workloads over an encode worker pool.
+
+        Texts are encoded in length-sorted order so each batch pads to the
+        length of similar-sized neighbors rather than the longest page in an
+        arbitrary mix; results are scattered back to the caller's order.
+        """
+        sort_order = np.argsort([len(t) for t in texts_clean], kind="stable")
+        texts_sorted = [texts_clean[i] for i in sort_order]
+        if (
+            self.device == "cpu"
+            and len(texts_clean) >= 128
+            and (os.cpu_count() or 1) >= 4
+        ):
+            if self._mp_pool is None:
+                workers = min(4, os.cpu_count())
+                # Pool workers are spawned, so they don't inherit parent
+                # thread settings - but they do inherit the environment.
+                # One BLAS/OMP thread per worker, otherwise the pool
+                # oversubscribes the cores it was meant to fill
+                os.environ.setdefault("OMP_NUM_THREADS", "1")
+                self._mp_pool = self.embedding_model.start_multi_process_pool(["cpu"] * workers)
+            encoded = self.embedding_model.encode_multi_process(
+                texts_sorted,
+                self._mp_pool,
+                batch_size=64,
+                normalize_embeddings=True,
+            )
+        else:
+            # convert_to_tensor keeps the batches on-device and concatenates
+            # them there; one transfer + one float32 buffer at the end beats
+            # a per-batch numpy copy (and a host round trip per batch on CUDA)
+            encoded = self.embedding_model.encode(
+                texts_sorted,
+                batch_size=64,
+                normalize_embeddings=True,
+                convert_to_tensor=True,
+                show_progress_bar=False,
+                device=self.device,
+            )
+            encoded = encoded.float().cpu().numpy()
+        encoded = np.asarray(encoded, dtype=np.float32)
+        out = np.empty_like(encoded)
+        out[sort_order] = encoded
+        return out
+
+    def _group_duplicate_pages(self, texts: List[str]) -> Tuple[List[int], Dict[int, List[int]]]:
+        """Group identical pages (after whitespace/case normalization).
+
+        Legal PDFs are full of repeated boilerplate - blank separators,
+        signature blanks, headers - and embedding plus ordering each copy is
+        wasted work. Returns the representative index per group and a map
+        from representative to all member indices in original order.
+        """
+        groups: Dict[str, List[int]] = {}
+        for i, t in enumerate(texts):
+            key = hashlib.blake2b(
+                re.sub(r'\s+', ' ', t.strip().lower()).encode("utf-8"),
+                digest_size=16,
+            ).hexdigest()
+            groups.setdefault(key, []).append(i)
+        reps = [members[0] for members in groups.values()]
+        return reps, {members[0]: members for members in groups.values()}
+
+    def insert_missing_pages(self, order: List[int], texts: List[str]) -> List[int]:
+        """Complete a partial ordering by inserting missing pages where they
+        fit best semantically.
+
+        For each missing page, the candidate score of every insertion slot is
+        the mean similarity to the slot's left and right neighbors, computed
+        in one vectorized pass over the ordered row (nan-padded at the ends)
+        instead of a Python loop over positions.
+        """
+        present = set(order)
+        missing = [i for i in range(len(texts)) if i not in present]
+        if not missing:
+            return list(order)
+        if self.embedding_model is None:
+            return list(order) + missing
+
+        sim = self._similarity_matrix(self._embed_pages(texts))
+        completed = list(order)
+        for idx in missing:
+            neighbors = sim[idx, np.asarray(completed, dtype=np.int64)]
+            left = np.concatenate(([np.nan], neighbors))
+            right = np.concatenate((neighbors, [np.nan]))
+            avg = np.nanmean(np.stack([left, right]), axis=0)
+            completed.insert(int(np.nanargmax(avg)), idx)
+        return completed
+
+    def _similarity_matrix(self, embeddings: np.ndarray) -> np.ndarray:
+        """Pairwise cosine similarity as one float32 BLAS matmul.
+
+        Every embedding path (_encode_batch, the cache, the blank-page
+        sentinel) produces unit-norm rows, so no renormalization pass is
+        needed here.
+        """
+        embs = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if simsimd is not None and embs.shape[0] >= 256:
+            # AVX-512/NEON cosine kernels beat the GEMM once the matrix is
+            # big; fp16 input halves the memory traffic on top, and cosine
+            # ranking is insensitive to the precision loss
+            e16 = embs.astype(np.float16)
+            return 1.0 - np.asarray(simsimd.cdist(e16, e16, metric="cosine"), dtype=np.float32)
+        # NumPy has no native fp16 GEMM (it upconverts element-wise, slower
+        # than SGEMM), so the BLAS path stays in float32
+        return embs @ embs.T
+
+    def _greedy_order_presorted(self, similarity_matrix: np.ndarray, start: int) -> Tuple[List[int], List[float]]:
+        """Greedy traversal over rows argsorted once by descending similarity.
+
+        One O(n^2 log n) sort up front; each pick then scans its presorted row
+        and usually stops after a couple of already-taken probes, instead of
+        re-reading the full similarity row every step.
+        """
+        n = similarity_matrix.shape[0]
+        presorted = np.argsort(-similarity_matrix, axis=1, kind="stable").astype(np.int32)
+        taken = np.zeros(n, dtype=bool)
+        taken[start] = True
+        order = np.empty(n, dtype=np.int32)
+        order[0] = start
+        consecutive_similarities = []
+
+        cur = start
+        for step in range(1, n):
+            nxt = start
+            for j in presorted[cur]:
+                if not taken[j]:
+                    nxt = int(j)
+                    break
+            consecutive_similarities.append(float(similarity_matrix[cur, nxt]))
+            taken[nxt] = True
+            order[step] = nxt
+            cur = nxt
+
+        return [int(i) for i in order], consecutive_similarities
+
+    def _greedy_order(self, similarity_matrix: np.ndarray, start: int) -> Tuple[List[int], List[float]]:
+        """Greedy nearest-neighbor traversal using a masked argmax per step."""
+        n = similarity_matrix.shape[0]
+        if n >= 128:
+            return self._greedy_order_presorted(similarity_matrix, start)
+        order = np.empty(n, dtype=np.int32)
+        order[0] = start
+        taken = np.zeros(n, dtype=bool)
+        taken[start] = True
+        consecutive_similarities = []
+
+        cur = start
+        for step in range(1, n):
+            row = similarity_matrix[cur]
+            # One row copy plus a masked assign; cheaper than np.where, which
+            # materializes the full -inf alternative each step
+            masked = row.copy()
+            masked[taken] = -np.inf
+            nxt = int(masked.argmax())
+            consecutive_similarities.append(float(row[nxt]))
+            taken[nxt] = True
+            order[step] = nxt
+            cur = nxt
+
+        return [int(i) for i in order], consecutive_similarities
+
+    def _tsp_order(self, similarity_matrix: np.ndarray) -> Tuple[List[int], List[float]]:
+        """Order pages as an open TSP over 1 - similarity using Lin-Kernighan.
+
+        The k-opt moves escape the local minima greedy nearest-neighbor falls
+        into (visible as large confidence drops mid-document), at sub-second
+        cost for the page counts this service sees.
+        """
+        n = similarity_matrix.shape[0]
+        dist = 1.0 - similarity_matrix
+        np.fill_diagonal(dist, 0.0)
+
+        # Dummy node with zero-cost edges to everything turns the closed tour
+        # into an open path
+        padded = np.zeros((n + 1, n + 1), dtype=np.float64)
+        padded[:n, :n] = dist
+        if solve_tsp_dynamic_programming is not None and n <= 12:
+            # Held-Karp is exact and takes only milliseconds at this size
+            # (its 2^n state table rules it out for anything much larger)
+            permutation, _ = solve_tsp_dynamic_programming(padded)
+        else:
+            permutation, _ = solve_tsp_lin_kernighan(padded)
+
+        cut = permutation.index(n)
+        order = [int(i) for i in permutation[cut + 1:] + permutation[:cut]]
+        consecutive = [float(similarity_matrix[order[i - 1], order[i]]) for i in range(1, n)]
+        return order, consecutive
+
+    def attempt_ordering(self, page_contents: List[Dict],
+                         precomputed_embeddings=None) -> OrderingResult:
+        """Order pages by semantic flow.
+
+        precomputed_embeddings: optional full-document embedding matrix
+        computed upstream (e.g. overlapped with extraction). Passed per call
+        rather than stored on the strategy, which is shared across concurrent
+        requests.
+        """
         if not self.embedding_model:
             return OrderingResult(
                 order=list(range(len(page_contents))),
@@ -431,51 +789,38 @@ class SemanticSimilarityStrategy(BaseOrderingStrategy):
         
         try:
             texts = [page['content'] for page in page_contents]
-            embeddings = self.embedding_model.encode(texts)
-            similarity_matrix = cosine_similarity(embeddings)
-            
-            # Greedy ordering based on similarity
+
+            # Embed and order one representative per duplicate group; the
+            # duplicates are spliced back in right after their representative
+            reps, dup_groups = self._group_duplicate_pages(texts)
+            if len(reps) < len(texts):
+                print(f"Deduplicated {len(texts)} pages down to {len(reps)} unique pages")
+
+            pre = precomputed_embeddings
+            if pre is not None and len(pre) == len(texts):
+                embeddings = np.asarray(pre, dtype=np.float32)[reps]
+            else:
+                embeddings = self._embed_pages([texts[i] for i in reps])
+            similarity_matrix = self._similarity_matrix(embeddings)
+
+            if solve_tsp_lin_kernighan is not None and 5 <= len(reps) <= self._TSP_MAX_PAGES:
+                rep_order, rep_sims = self._tsp_order(similarity_matrix)
+            else:
+                # Start with the page least similar to everything else (likely a
+                # title page), then greedily follow the most similar unused page
+                avg_similarities = np.mean(similarity_matrix, axis=1)
+                start = int(np.argmin(avg_similarities))
+                rep_order, rep_sims = self._greedy_order(similarity_matrix, start)
+
             order = []
-            used = set()
-            
-            # Start with page that has highest average similarity
-            avg_similarities = np.mean(similarity_matrix, axis=1)
-            current = np.argmin(avg_similarities)
-            order.append(current)
-            used.add(current)
-            
-            # Add most similar unused pages
-            while len(order) < len(page_contents):
-                best_similarity = -1
-                best_page = -1
-                
-                for candidate in range(len(page_contents)):
-                    if candidate in used:
-                        continue
-                    
-                    sim = similarity_matrix[current][candidate]
-                    if sim > best_similarity:
-                        best_similarity = sim
-                        best_page = candidate
-                
-                if best_page != -1:
-                    order.append(best_page)
-                    used.add(best_page)
-                    current = best_page
-                else:
-                    # Add remaining pages
-                    for i in range(len(page_contents)):
-                        if i not in used:
-                            order.append(i)
-                            used.add(i)
-                    break
-            
-            # Calculate confidence
             consecutive_similarities = []
-            for i in range(len(order) - 1):
-                sim = similarity_matrix[order[i]][order[i + 1]]
-                consecutive_similarities.append(sim)
-            
+            for pos, local_idx in enumerate(rep_order):
+                members = dup_groups[reps[local_idx]]
+                if pos > 0:
+                    consecutive_similarities.append(rep_sims[pos - 1])
+                consecutive_similarities.extend([1.0] * (len(members) - 1))
+                order.extend(members)
+
             avg_consecutive_sim = np.mean(consecutive_similarities) if consecutive_similarities else 0
             confidence = min(0.9, max(0.3, avg_consecutive_sim))
             
@@ -581,31 +926,39 @@ class LLMReasoningStrategy(BaseOrderingStrategy):
             Pages:
             {chr(10).join(page_summaries)}
             
-            Return the optimal order as a comma-separated list of page indices (0-based).
-            Also provide a confidence score (0.0-1.0) and brief reasoning. 
-            
-            Format:
-            ORDER: 0,2,1,3
-            CONFIDENCE: 0.85
-            REASONING: Page 0 has header content, page 2 contains main information, etc.
+            Respond with a JSON object of the form:
+            {{"order": [0, 2, 1, 3], "confidence": 0.85, "reasoning": "brief explanation"}}
+            where "order" lists all page indices (0-based), "confidence" is
+            between 0.0 and 1.0, and "reasoning" is a short sentence.
             """
-            
-            response = self.gemini_client.generate_content(prompt)
+
+            # JSON mode constrains decoding to valid JSON, so parsing is a
+            # single loads() instead of regex fishing over free-form prose
+            response = self.gemini_client.generate_content(
+                prompt,
+                generation_config={"response_mime_type": "application/json"},
+            )
             response_text = response.text
-            
-            # Parse response
-            order_match = re.search(r'ORDER:\s*([0-9,\s]+)', response_text)
-            confidence_match = re.search(r'CONFIDENCE:\s*([0-9.]+)', response_text)
-            reasoning_match = re.search(r'REASONING:\s*(.+)', response_text, re.DOTALL)
-            
-            if order_match:
-                order_str = order_match.group(1).strip()
-                order = [int(x.strip()) for x in order_str.split(',')]
-                
-                if len(order) == len(page_contents) and all(0 <= x < len(page_contents) for x in order):
-                    confidence = float(confidence_match.group(1)) if confidence_match else 0.6
-                    reasoning = [reasoning_match.group(1).strip()] if reasoning_match else ['AI reasoning applied']
-                    
+
+            order = None
+            confidence = 0.6
+            reasoning = ['AI reasoning applied']
+            try:
+                parsed = _loads(response_text)
+                order = parsed.get('order')
+                confidence = float(parsed.get('confidence', confidence))
+                if parsed.get('reasoning'):
+                    reasoning = [str(parsed['reasoning']).strip()]
+            except (ValueError, AttributeError):
+                # Fall back to scraping a bare list out of a malformed reply
+                list_match = re.search(r'\[[\s\d,]+\]', response_text)
+                if list_match:
+                    order = _loads(list_match.group(0))
+
+            if order is not None:
+                order = [int(x) for x in order]
+                # Must be a full permutation: right length, no duplicates, no gaps
+                if sorted(order) == list(range(len(page_contents))):
                     return OrderingResult(
                         order=order,
                         confidence=min(0.9, max(0.4, confidence)),
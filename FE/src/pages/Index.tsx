@@ -68,15 +68,17 @@ const Index: React.FC = () => {
         },
       });
 
-      // Extract backend logs from response headers
-      const logsHeader = response.headers['x-backend-logs'];
-      if (logsHeader) {
+      // Fetch backend logs via the logs endpoint (the request id comes from
+      // the result metadata header; logs no longer travel in a header)
+      const metaHeader = response.headers['x-result-meta'];
+      if (metaHeader) {
         try {
-          const decodedLogs = JSON.parse(decodeURIComponent(logsHeader));
-          setBackendLogs(prev => [...prev, "📡 Received backend logs:", ...decodedLogs]);
+          const meta = JSON.parse(metaHeader);
+          const logsResponse = await axios.get(`http://127.0.0.1:8000/logs/${meta.request_id}`);
+          setBackendLogs(prev => [...prev, "📡 Received backend logs:", ...logsResponse.data.logs]);
         } catch (err) {
-          console.error("Failed to parse backend logs:", err);
-          setBackendLogs(prev => [...prev, "⚠️ Could not parse backend logs"]);
+          console.error("Failed to fetch backend logs:", err);
+          setBackendLogs(prev => [...prev, "⚠️ Could not fetch backend logs"]);
         }
       }
 